@@ -1,26 +1,51 @@
 import csv
-import json
+import functools
+import heapq
 import os
 import re
+import stat
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime, timedelta, timezone
+from operator import itemgetter
 from pathlib import Path
 
+import orjson
 from dotenv import load_dotenv
 from flask import (
     Flask,
+    Response,
     abort,
     jsonify,
     render_template,
     request,
-    send_from_directory,
+    send_file,
 )
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from flask.json.provider import JSONProvider
 import requests
+from requests.adapters import HTTPAdapter
 
 load_dotenv(override=True)
 
+
+class OrjsonProvider(JSONProvider):
+    """Encode/decode JSON with orjson for jsonify() and request.get_json()."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        # Hand orjson's bytes straight to the response instead of round-tripping via str.
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 DATE_RANGE_OPTIONS = {
     "1d": {"label": "Past day", "days": 1},
@@ -38,6 +63,7 @@ TOPIC_FILTERS = {
     },
 }
 DEFAULT_TOPIC = "none"
+TOPIC_LABEL_BY_KEY = {key: config.get("label", "All topics") for key, config in TOPIC_FILTERS.items()}
 VALID_DURATION_FILTERS = {
     "any": "Any length",
     "short": "Under 4 minutes",
@@ -49,12 +75,54 @@ SEARCH_ORDER = "viewCount"
 MAX_DISCORD_RESULTS = 5
 DATA_DIR = Path(__file__).resolve().parent / "data"
 SLUG_PATTERN = re.compile(r"[^a-z0-9]+")
+YOUTUBE_SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
+YOUTUBE_VIDEOS_URL = "https://www.googleapis.com/youtube/v3/videos"
 SEARCH_QUOTA_COST = 100
 STATS_QUOTA_COST = 1
+STATS_BATCH_SIZE = 50
+# Partial-response selectors: only the fields search_youtube actually reads.
+# The etag is kept so stale cache entries can be revalidated with If-None-Match.
+SEARCH_FIELDS = (
+    "etag,"
+    "items(id/videoId,snippet(title,description,channelTitle,publishedAt,thumbnails/medium/url))"
+)
+STATS_FIELDS = "etag,items(id,statistics/viewCount)"
 APP_AUTH_TOKEN = os.getenv("APP_AUTH_TOKEN")
+YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
+DISCORD_WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL")
+# Pre-serialized bodies for the common validation/auth failures.
+_ERR_QUERY_REQUIRED = b'{"error":"Query is required."}'
+_ERR_UNAUTHORIZED = b'{"error":"Invalid or missing app token."}'
+_ERR_SAVE_REQUIRES_RESULTS = b'{"error":"A query and at least one result are required to save."}'
+_ERR_SHARE_REQUIRES_RESULTS = b'{"error":"A query and at least one result are required to share."}'
+CACHE_TTL_HOURS = float(os.getenv("CACHE_TTL_HOURS") or 24)
+CACHE_MAX_ENTRIES = 256
+
+_RESPONSE_CACHE = {}
+_RESPONSE_CACHE_LOCK = threading.Lock()
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+# One pooled session (YouTube API and Discord webhook) so keep-alive TCP/TLS
+# connections are reused across requests.
+_HTTP_SESSION = requests.Session()
+_HTTP_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
 
 DATA_DIR.mkdir(exist_ok=True)
 
+if not YOUTUBE_API_KEY:
+    app.logger.warning("YOUTUBE_API_KEY is not set; /api/search will fail until it is configured.")
+if not DISCORD_WEBHOOK_URL:
+    app.logger.warning("DISCORD_WEBHOOK_URL is not set; Discord sharing is disabled.")
+
+
+class YouTubeAPIError(Exception):
+    """Raised when the YouTube Data API answers with an error status."""
+
+
+def _error_response(body: bytes, status: int) -> Response:
+    return Response(body, status=status, mimetype="application/json")
+
 
 def ensure_authorized():
     """Require the optional app token for mutating/archive endpoints."""
@@ -66,22 +134,47 @@ def ensure_authorized():
         or ((request.get_json(silent=True) or {}).get("token"))
     )
     if candidate != APP_AUTH_TOKEN:
-        abort(401, description="Invalid or missing app token.")
+        abort(_error_response(_ERR_UNAUTHORIZED, 401))
 
 
 def _require_api_key() -> str:
-    """Fetch the API key or fail fast with a descriptive error."""
-    api_key = os.getenv("YOUTUBE_API_KEY")
-    if not api_key:
+    """Return the API key read at startup or fail fast with a descriptive error."""
+    if not YOUTUBE_API_KEY:
         raise RuntimeError(
             "Missing YOUTUBE_API_KEY environment variable. "
             "Create an API key in Google Cloud Console and export it."
         )
-    return api_key
+    return YOUTUBE_API_KEY
+
+
+def _youtube_get(url: str, params: dict, etag: str | None = None) -> dict | None:
+    """GET a YouTube endpoint; returns None when ``etag`` is still current (HTTP 304)."""
+    headers = {"If-None-Match": etag} if etag else None
+    response = _HTTP_SESSION.get(
+        url, params={**params, "key": _require_api_key()}, headers=headers, timeout=15
+    )
+    if response.status_code == 304:
+        return None
+    if response.status_code >= 400:
+        try:
+            message = response.json()["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            message = response.text[:200]
+        raise YouTubeAPIError(f"status {response.status_code}: {message}")
+    try:
+        return response.json()
+    except ValueError as exc:
+        raise YouTubeAPIError(
+            f"status {response.status_code}: invalid JSON response: {response.text[:200]}"
+        ) from exc
+
 
+def _search_api(params: dict, etag: str | None = None) -> dict | None:
+    return _youtube_get(YOUTUBE_SEARCH_URL, params, etag)
 
-def build_youtube_client():
-    return build("youtube", "v3", developerKey=_require_api_key(), cache_discovery=False)
+
+def _videos_api(params: dict, etag: str | None = None) -> dict | None:
+    return _youtube_get(YOUTUBE_VIDEOS_URL, params, etag)
 
 
 def _normalize_date_range(range_key: str) -> dict:
@@ -96,27 +189,73 @@ def _normalize_topic(topic_key: str) -> dict:
     return TOPIC_FILTERS.get(topic_key, TOPIC_FILTERS[DEFAULT_TOPIC])
 
 
-def fetch_video_statistics(client, video_ids):
-    if not video_ids:
-        return {}
-    response = (
-        client.videos()
-        .list(
-            part="statistics",
-            id=",".join(video_ids),
-        )
-        .execute()
+def _cached_response(key: tuple, loader):
+    """Return ``(response, cache_hit)`` for ``key``.
+
+    Fresh entries are served without touching the API. Stale entries are passed to
+    ``loader`` as an etag; a ``None`` result (304 Not Modified) keeps the cached body.
+    """
+    now = time.monotonic()
+    with _RESPONSE_CACHE_LOCK:
+        entry = _RESPONSE_CACHE.get(key)
+    if entry and now - entry["ts"] < CACHE_TTL_HOURS * 3600:
+        return entry["body"], True
+
+    body = loader(entry["etag"] if entry else None)
+    cache_hit = body is None
+    if cache_hit:
+        body = entry["body"]
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE.pop(key, None)
+        while len(_RESPONSE_CACHE) >= CACHE_MAX_ENTRIES:
+            _RESPONSE_CACHE.pop(next(iter(_RESPONSE_CACHE)))
+        _RESPONSE_CACHE[key] = {"etag": body.get("etag"), "body": body, "ts": now}
+    return body, cache_hit
+
+
+def clear_cache() -> int:
+    with _RESPONSE_CACHE_LOCK:
+        cleared = len(_RESPONSE_CACHE)
+        _RESPONSE_CACHE.clear()
+    return cleared
+
+
+def _raw_search(search_items: tuple):
+    return _cached_response(
+        ("search", search_items),
+        lambda etag: _search_api(dict(search_items), etag),
     )
+
+
+def _raw_stats(video_ids: tuple):
+    return _cached_response(
+        ("videos", video_ids),
+        lambda etag: _videos_api(
+            {"part": "statistics", "id": ",".join(video_ids), "fields": STATS_FIELDS}, etag
+        ),
+    )
+
+
+def fetch_video_statistics(video_ids):
+    """Map video IDs to view counts; also returns the quota spent (0 on cache hits).
+
+    IDs are requested in chunks of ``STATS_BATCH_SIZE``, the API's per-call maximum.
+    """
     stats = {}
-    for item in response.get("items", []):
-        video_id = item.get("id")
-        if not video_id:
-            continue
-        try:
-            stats[video_id] = int(item.get("statistics", {}).get("viewCount", 0))
-        except (TypeError, ValueError):
-            stats[video_id] = 0
-    return stats
+    quota_cost = 0
+    for start in range(0, len(video_ids), STATS_BATCH_SIZE):
+        response, cache_hit = _raw_stats(tuple(video_ids[start : start + STATS_BATCH_SIZE]))
+        if not cache_hit:
+            quota_cost += STATS_QUOTA_COST
+        for item in response.get("items", []):
+            video_id = item.get("id")
+            if not video_id:
+                continue
+            try:
+                stats[video_id] = int(item.get("statistics", {}).get("viewCount", 0))
+            except (TypeError, ValueError):
+                stats[video_id] = 0
+    return stats, quota_cost
 
 
 def format_discord_message(snapshot: dict) -> str:
@@ -149,39 +288,37 @@ def format_discord_message(snapshot: dict) -> str:
 
 def post_to_discord(snapshot: dict):
     """Send the formatted snapshot to the configured Discord webhook."""
-    webhook_url = os.getenv("DISCORD_WEBHOOK_URL")
-    if not webhook_url:
+    if not DISCORD_WEBHOOK_URL:
         raise RuntimeError(
             "Missing DISCORD_WEBHOOK_URL. Set it in your environment to enable Discord exports."
         )
 
     payload = {"content": format_discord_message(snapshot)}
-    response = requests.post(webhook_url, json=payload, timeout=15)
+    response = _HTTP_SESSION.post(DISCORD_WEBHOOK_URL, json=payload, timeout=15)
     if response.status_code >= 400:
         raise RuntimeError(
             f"Discord webhook returned status {response.status_code}: {response.text[:200]}"
         )
 
 
+@functools.lru_cache(maxsize=1024)
 def _slugify(label: str) -> str:
     slug = SLUG_PATTERN.sub("-", label.lower()).strip("-")
     return slug or "search"
 
 
 def format_snapshot_text(snapshot: dict, saved_at: str) -> str:
-    query = snapshot.get("query", "Unknown query")
-    date_range = snapshot.get("dateRange", DEFAULT_DATE_RANGE)
-    duration = snapshot.get("duration", "any")
-    topic = snapshot.get("topic") or DEFAULT_TOPIC
-    items = snapshot.get("items") or []
+    g = snapshot.get
+    topic = g("topic") or DEFAULT_TOPIC
+    items = g("items") or []
 
     lines = [
         "YouTube Search Snapshot",
         f"Saved at: {saved_at}",
-        f"Query: {query}",
-        f"Date range: {date_range}",
-        f"Duration filter: {duration}",
-        f"Topic filter: {TOPIC_FILTERS.get(topic, {}).get('label', 'All topics')}",
+        f"Query: {g('query', 'Unknown query')}",
+        f"Date range: {g('dateRange', DEFAULT_DATE_RANGE)}",
+        f"Duration filter: {g('duration', 'any')}",
+        f"Topic filter: {TOPIC_LABEL_BY_KEY.get(topic, 'All topics')}",
         f"Results captured: {len(items)}",
         "",
     ]
@@ -194,7 +331,7 @@ def format_snapshot_text(snapshot: dict, saved_at: str) -> str:
         lines.append(
             f"    Channel: {item.get('channelTitle') or 'Unknown'} | "
             f"Published: {item.get('publishedAt') or 'Unknown'} | "
-            f"Views: {item.get('viewCount', 0)}"
+            f"Views: {item.get('viewCount') or 0}"
         )
         if item.get("description"):
             lines.append(f"    Description: {item['description'][:280]}")
@@ -223,7 +360,9 @@ def write_snapshot_to_file(snapshot: dict, export_format: str = "text") -> Path:
             "items": snapshot.get("items", []),
         }
         file_path = DATA_DIR / filename
-        file_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        file_path.write_bytes(
+            orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        )
     elif export_format == "csv":
         filename = f"{base_name}.csv"
         fieldnames = [
@@ -240,25 +379,29 @@ def write_snapshot_to_file(snapshot: dict, export_format: str = "text") -> Path:
             "description",
         ]
         file_path = DATA_DIR / filename
+        # Snapshot-level columns are identical on every row, so build them once.
+        prefix = (
+            snapshot.get("query"),
+            snapshot.get("dateRange"),
+            snapshot.get("duration"),
+            snapshot.get("topic") or DEFAULT_TOPIC,
+            saved_at_iso,
+        )
         with file_path.open("w", newline="", encoding="utf-8") as handle:
-            writer = csv.DictWriter(handle, fieldnames=fieldnames)
-            writer.writeheader()
-            for item in snapshot.get("items", []):
-                writer.writerow(
-                    {
-                        "query": snapshot.get("query"),
-                        "dateRange": snapshot.get("dateRange"),
-                        "duration": snapshot.get("duration"),
-                        "topic": snapshot.get("topic") or DEFAULT_TOPIC,
-                        "savedAt": saved_at_iso,
-                        "title": item.get("title"),
-                        "url": item.get("url"),
-                        "channelTitle": item.get("channelTitle"),
-                        "publishedAt": item.get("publishedAt"),
-                        "viewCount": item.get("viewCount"),
-                        "description": item.get("description"),
-                    }
+            writer = csv.writer(handle)
+            writer.writerow(fieldnames)
+            writer.writerows(
+                prefix
+                + (
+                    item.get("title"),
+                    item.get("url"),
+                    item.get("channelTitle"),
+                    item.get("publishedAt"),
+                    item.get("viewCount"),
+                    item.get("description"),
                 )
+                for item in snapshot.get("items", [])
+            )
     else:
         filename = f"{base_name}.txt"
         file_path = DATA_DIR / filename
@@ -266,35 +409,44 @@ def write_snapshot_to_file(snapshot: dict, export_format: str = "text") -> Path:
     return file_path
 
 
+@functools.lru_cache(maxsize=4)
+def _resolved_dir(path: Path) -> str:
+    """Resolve a directory once; keyed on the path so a swapped DATA_DIR is honoured."""
+    return os.path.realpath(path)
+
+
 def clear_data_directory() -> int:
     DATA_DIR.mkdir(exist_ok=True)
     deleted = 0
-    for item in DATA_DIR.iterdir():
-        if item.name == ".gitkeep":
-            continue
-        if item.is_file():
-            item.unlink()
-            deleted += 1
+    with os.scandir(DATA_DIR) as it:
+        for entry in it:
+            if entry.name == ".gitkeep":
+                continue
+            if entry.is_file():
+                os.unlink(entry.path)
+                deleted += 1
     return deleted
 
 
+@functools.lru_cache(maxsize=4096)
+def _format_mtime(mtime: float) -> str:
+    return datetime.fromtimestamp(mtime, timezone.utc).isoformat()
+
+
 def list_snapshot_files():
     DATA_DIR.mkdir(exist_ok=True)
-    entries = []
-    for entry in sorted(DATA_DIR.iterdir(), key=lambda f: f.stat().st_mtime, reverse=True):
-        if entry.name.startswith("."):
-            continue
-        if not entry.is_file():
-            continue
-        stats = entry.stat()
-        entries.append(
-            {
-                "name": entry.name,
-                "size": stats.st_size,
-                "modified": datetime.fromtimestamp(stats.st_mtime, timezone.utc).isoformat(),
-            }
-        )
-    return entries
+    # DirEntry caches its stat result, so each file is stat'ed once.
+    with os.scandir(DATA_DIR) as it:
+        entries = [
+            (entry.name, entry.stat())
+            for entry in it
+            if not entry.name.startswith(".") and entry.is_file()
+        ]
+    entries.sort(key=lambda pair: pair[1].st_mtime, reverse=True)
+    return [
+        {"name": name, "size": stats.st_size, "modified": _format_mtime(stats.st_mtime)}
+        for name, stats in entries
+    ]
 
 
 def search_youtube(
@@ -304,6 +456,42 @@ def search_youtube(
     duration: str = "any",
     max_results: int = 12,
     topic_key: str = DEFAULT_TOPIC,
+):
+    """Run a search, sharing one upstream call among identical concurrent requests."""
+    key = (query, range_key, duration, max_results, topic_key)
+    with _INFLIGHT_LOCK:
+        future = _INFLIGHT.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = _INFLIGHT[key] = Future()
+
+    if not is_leader:
+        results, _ = future.result()
+        # Only the leading request spent quota.
+        return results, 0
+
+    try:
+        outcome = _search_youtube(
+            query, range_key, duration=duration, max_results=max_results, topic_key=topic_key
+        )
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    else:
+        future.set_result(outcome)
+        return outcome
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(key, None)
+
+
+def _search_youtube(
+    query: str,
+    range_key: str,
+    *,
+    duration: str,
+    max_results: int,
+    topic_key: str,
 ):
     topic_config = _normalize_topic(topic_key)
     if not query and not topic_config.get("allows_empty_query"):
@@ -313,14 +501,15 @@ def search_youtube(
     normalized_duration = _normalize_duration_filter(duration)
     days_back = normalized_range["days"]
 
+    # Round to the hour so repeated searches share a cache key within the TTL window.
     published_after = datetime.utcnow() - timedelta(days=days_back)
-    published_after_iso = published_after.replace(microsecond=0).isoformat() + "Z"
+    published_after_iso = published_after.replace(minute=0, second=0, microsecond=0).isoformat() + "Z"
 
     capped_results = max(1, min(max_results, MAX_ALLOWED_RESULTS))
-    client = build_youtube_client()
 
     search_kwargs = {
         "part": "snippet",
+        "fields": SEARCH_FIELDS,
         "type": "video",
         "order": SEARCH_ORDER,
         "maxResults": capped_results,
@@ -333,7 +522,7 @@ def search_youtube(
     if topic_config.get("topicId"):
         search_kwargs["topicId"] = topic_config["topicId"]
 
-    response = client.search().list(**search_kwargs).execute()
+    response, search_cached = _raw_search(tuple(sorted(search_kwargs.items())))
     results = []
     video_ids = []
     for item in response.get("items", []):
@@ -354,11 +543,11 @@ def search_youtube(
                 "url": f"https://www.youtube.com/watch?v={video_id}",
             }
         )
-    view_counts = fetch_video_statistics(client, video_ids)
+    view_counts, stats_cost = fetch_video_statistics(video_ids)
     for result in results:
         result["viewCount"] = view_counts.get(result["videoId"], 0)
-    results.sort(key=lambda item: item.get("viewCount", 0), reverse=True)
-    quota_cost = SEARCH_QUOTA_COST + (STATS_QUOTA_COST if video_ids else 0)
+    results = heapq.nlargest(capped_results, results, key=itemgetter("viewCount"))
+    quota_cost = (0 if search_cached else SEARCH_QUOTA_COST) + stats_cost
     return results, quota_cost
 
 
@@ -388,6 +577,8 @@ def api_search():
     duration = payload.get("duration") or "any"
     requested_limit = payload.get("maxResults") or 12
     topic_key = payload.get("topic") or DEFAULT_TOPIC
+    if not query and not _normalize_topic(topic_key).get("allows_empty_query"):
+        return _error_response(_ERR_QUERY_REQUIRED, 400)
 
     try:
         results, quota_cost = search_youtube(
@@ -401,9 +592,8 @@ def api_search():
         return jsonify({"error": str(exc)}), 400
     except RuntimeError as exc:
         return jsonify({"error": str(exc)}), 500
-    except HttpError as exc:
-        error_message = exc.error_details if hasattr(exc, "error_details") else str(exc)
-        return jsonify({"error": f"YouTube API error: {error_message}"}), 502
+    except (YouTubeAPIError, requests.RequestException) as exc:
+        return jsonify({"error": f"YouTube API error: {exc}"}), 502
 
     return jsonify({"items": results, "quotaUsed": quota_cost})
 
@@ -421,10 +611,7 @@ def save_snapshot():
     snapshot.pop("token", None)
 
     if (not query and not topic_config.get("allows_empty_query")) or not items:
-        return (
-            jsonify({"error": "A query and at least one result are required to save."}),
-            400,
-        )
+        return _error_response(_ERR_SAVE_REQUIRES_RESULTS, 400)
 
     try:
         saved_file = write_snapshot_to_file(snapshot, export_format=export_format)
@@ -445,10 +632,7 @@ def notify_discord():
     topic_config = _normalize_topic(topic_key)
 
     if (not query and not topic_config.get("allows_empty_query")) or not items:
-        return (
-            jsonify({"error": "A query and at least one result are required to share."}),
-            400,
-        )
+        return _error_response(_ERR_SHARE_REQUIRES_RESULTS, 400)
 
     try:
         post_to_discord(snapshot)
@@ -465,6 +649,13 @@ def clear_archive():
     return jsonify({"status": "ok", "deleted": deleted})
 
 
+@app.post("/api/cache/clear")
+def clear_search_cache():
+    ensure_authorized()
+    cleared = clear_cache()
+    return jsonify({"status": "ok", "cleared": cleared})
+
+
 @app.get("/api/snapshots")
 def get_snapshots():
     ensure_authorized()
@@ -475,11 +666,21 @@ def get_snapshots():
 @app.get("/archive/<path:filename>")
 def download_snapshot(filename: str):
     ensure_authorized()
-    target = (DATA_DIR / filename).resolve()
+    data_dir = _resolved_dir(DATA_DIR)
+    target = os.path.realpath(os.path.join(data_dir, filename))
+    if os.path.commonpath([target, data_dir]) != data_dir:
+        abort(404)
     try:
-        target.relative_to(DATA_DIR.resolve())
-    except ValueError:
+        target_stat = os.stat(target)
+    except OSError:
         abort(404)
-    if not target.exists() or not target.is_file():
+    if not stat.S_ISREG(target_stat.st_mode):
         abort(404)
-    return send_from_directory(DATA_DIR, target.name, as_attachment=True)
+    # Conditional responses let repeat downloads revalidate and get a 304 instead of the body.
+    return send_file(
+        target,
+        as_attachment=True,
+        conditional=True,
+        etag=True,
+        last_modified=target_stat.st_mtime,
+    )
@@ -1,3 +1,6 @@
+import json
+import threading
+
 import app as app_module
 import pytest
 from app import app as flask_app
@@ -14,6 +17,13 @@ def reset_auth_token(monkeypatch):
     monkeypatch.setattr(app_module, "APP_AUTH_TOKEN", None)
 
 
+@pytest.fixture(autouse=True)
+def reset_response_cache():
+    app_module.clear_cache()
+    yield
+    app_module.clear_cache()
+
+
 @pytest.fixture
 def data_dir(monkeypatch, tmp_path):
     tmp_path.mkdir(exist_ok=True)
@@ -30,9 +40,14 @@ def test_home(client):
 def test_api_search_requires_query(client):
     response = client.post("/api/search", json={"query": "", "topic": "none"})
     assert response.status_code == 400
-    assert b"Query is required" in response.data
+    assert response.get_json() == {"error": "Query is required."}
     
 
+def test_api_search_rejects_malformed_json(client):
+    response = client.post("/api/search", data="{not json", content_type="application/json")
+    assert response.status_code == 400
+
+
 def test_api_search_allows_topic_without_query(client, monkeypatch):
     stub_response = [{"videoId": "gaming"}]
 
@@ -65,6 +80,193 @@ def test_api_search_returns_mocked_results(client, monkeypatch):
     assert payload["quotaUsed"] == 42
 
 
+class FakeYouTubeAPI:
+    def __init__(self, monkeypatch):
+        self.calls = {"search": 0, "videos": 0}
+        monkeypatch.setattr(app_module, "_search_api", self.search)
+        monkeypatch.setattr(app_module, "_videos_api", self.videos)
+
+    def search(self, params, etag=None):
+        self.calls["search"] += 1
+        return {"items": [{"id": {"videoId": "v1"}, "snippet": {"title": "One"}}]}
+
+    def videos(self, params, etag=None):
+        self.calls["videos"] += 1
+        return {"items": [{"id": "v1", "statistics": {"viewCount": "7"}}]}
+
+
+def test_search_youtube_caches_responses(monkeypatch):
+    fake = FakeYouTubeAPI(monkeypatch)
+
+    results, quota = app_module.search_youtube("python", "7d")
+    assert results[0]["viewCount"] == 7
+    assert quota == app_module.SEARCH_QUOTA_COST + app_module.STATS_QUOTA_COST
+
+    cached_results, cached_quota = app_module.search_youtube("python", "7d")
+    assert cached_results == results
+    assert cached_quota == 0
+    assert fake.calls == {"search": 1, "videos": 1}
+
+
+def test_search_youtube_orders_by_views(monkeypatch):
+    ids = ["a", "b", "c"]
+    monkeypatch.setattr(
+        app_module,
+        "_search_api",
+        lambda params, etag=None: {"items": [{"id": {"videoId": vid}, "snippet": {}} for vid in ids]},
+    )
+    monkeypatch.setattr(
+        app_module,
+        "_videos_api",
+        lambda params, etag=None: {
+            "items": [{"id": vid, "statistics": {"viewCount": str(views)}} for vid, views in zip(ids, (5, 50, 20))]
+        },
+    )
+    results, _ = app_module.search_youtube("python", "7d", max_results=3)
+    assert [item["videoId"] for item in results] == ["b", "c", "a"]
+
+
+def test_fetch_video_statistics_batches_ids(monkeypatch):
+    requested = []
+
+    def fake_videos(params, etag=None):
+        ids = params["id"].split(",")
+        requested.append(len(ids))
+        return {"items": [{"id": vid, "statistics": {"viewCount": "1"}} for vid in ids]}
+
+    monkeypatch.setattr(app_module, "_videos_api", fake_videos)
+    video_ids = [f"v{i}" for i in range(120)]
+    stats, quota = app_module.fetch_video_statistics(video_ids)
+    assert requested == [50, 50, 20]
+    assert len(stats) == 120
+    assert quota == 3 * app_module.STATS_QUOTA_COST
+    assert app_module.fetch_video_statistics([]) == ({}, 0)
+
+
+def test_search_youtube_joins_inflight_request(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("YouTube API should not be called")
+
+    monkeypatch.setattr(app_module, "_search_api", fail)
+    pending = app_module.Future()
+    key = ("python", "7d", "any", 12, "none")
+    monkeypatch.setitem(app_module._INFLIGHT, key, pending)
+
+    outcome = {}
+    waiter = threading.Thread(target=lambda: outcome.update(result=app_module.search_youtube("python", "7d")))
+    waiter.start()
+    pending.set_result(([{"videoId": "shared"}], 101))
+    waiter.join(timeout=5)
+    assert outcome["result"] == ([{"videoId": "shared"}], 0)
+
+
+def test_search_youtube_leader_shares_errors(monkeypatch):
+    leader_started = threading.Event()
+    waiter_blocked = threading.Event()
+    release_leader = threading.Event()
+
+    class SignallingFuture(app_module.Future):
+        def result(self, timeout=None):
+            waiter_blocked.set()
+            return super().result(timeout)
+
+    def failing_search(params, etag=None):
+        leader_started.set()
+        release_leader.wait(timeout=5)
+        raise app_module.YouTubeAPIError("status 403: quotaExceeded")
+
+    monkeypatch.setattr(app_module, "Future", SignallingFuture)
+    monkeypatch.setattr(app_module, "_search_api", failing_search)
+
+    errors = {}
+
+    def run(name):
+        try:
+            app_module.search_youtube("python", "7d")
+        except app_module.YouTubeAPIError as exc:
+            errors[name] = exc
+
+    leader = threading.Thread(target=run, args=("leader",))
+    leader.start()
+    assert leader_started.wait(timeout=5)
+    waiter = threading.Thread(target=run, args=("waiter",))
+    waiter.start()
+    assert waiter_blocked.wait(timeout=5)
+    release_leader.set()
+    leader.join(timeout=5)
+    waiter.join(timeout=5)
+
+    assert set(errors) == {"leader", "waiter"}
+    assert errors["waiter"] is errors["leader"]
+    assert app_module._INFLIGHT == {}
+
+
+def test_stale_cache_entry_revalidated_with_etag(monkeypatch):
+    class FakeResponse:
+        def __init__(self, status_code, body=None):
+            self.status_code = status_code
+            self.body = body
+
+        def json(self):
+            return self.body
+
+    sent_headers = []
+    responses = [
+        FakeResponse(200, {"etag": "abc", "items": [{"id": "v1", "statistics": {"viewCount": "3"}}]}),
+        FakeResponse(304),
+    ]
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        sent_headers.append(headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(app_module, "YOUTUBE_API_KEY", "key")
+    monkeypatch.setattr(app_module, "CACHE_TTL_HOURS", 0)
+    monkeypatch.setattr(app_module._HTTP_SESSION, "get", fake_get)
+
+    assert app_module.fetch_video_statistics(["v1"]) == ({"v1": 3}, app_module.STATS_QUOTA_COST)
+    assert app_module.fetch_video_statistics(["v1"]) == ({"v1": 3}, 0)
+    assert sent_headers == [None, {"If-None-Match": "abc"}]
+
+
+def test_api_search_reports_youtube_errors(client, monkeypatch):
+    class FakeResponse:
+        status_code = 403
+        text = "forbidden"
+
+        def json(self):
+            return {"error": {"message": "quotaExceeded"}}
+
+    monkeypatch.setattr(app_module, "YOUTUBE_API_KEY", "key")
+    monkeypatch.setattr(app_module._HTTP_SESSION, "get", lambda *args, **kwargs: FakeResponse())
+    response = client.post("/api/search", json={"query": "python"})
+    assert response.status_code == 502
+    assert "quotaExceeded" in response.get_json()["error"]
+
+
+def test_api_search_reports_invalid_youtube_json(client, monkeypatch):
+    class FakeResponse:
+        status_code = 200
+        text = "<html>proxy error</html>"
+
+        def json(self):
+            raise ValueError("Expecting value: line 1 column 1 (char 0)")
+
+    monkeypatch.setattr(app_module, "YOUTUBE_API_KEY", "key")
+    monkeypatch.setattr(app_module._HTTP_SESSION, "get", lambda *args, **kwargs: FakeResponse())
+    response = client.post("/api/search", json={"query": "python"})
+    assert response.status_code == 502
+    assert "invalid JSON response" in response.get_json()["error"]
+
+
+def test_clear_cache_endpoint(client, monkeypatch):
+    FakeYouTubeAPI(monkeypatch)
+    app_module.search_youtube("python", "7d")
+    response = client.post("/api/cache/clear")
+    assert response.status_code == 200
+    assert response.get_json()["cleared"] == 2
+
+
 def test_notify_requires_results(client):
     response = client.post("/api/notify", json={"query": "python", "items": []})
     assert response.status_code == 400
@@ -91,6 +293,25 @@ def test_notify_invokes_discord_hook(client, monkeypatch):
     assert captured["snapshot"]["query"] == "python"
 
 
+def test_post_to_discord_uses_shared_session(monkeypatch):
+    captured = {}
+
+    class FakeResponse:
+        status_code = 204
+        text = ""
+
+    def fake_post(url, json=None, timeout=None):
+        captured["url"] = url
+        captured["content"] = json["content"]
+        return FakeResponse()
+
+    monkeypatch.setattr(app_module, "DISCORD_WEBHOOK_URL", "https://discord.test/hook")
+    monkeypatch.setattr(app_module._HTTP_SESSION, "post", fake_post)
+    app_module.post_to_discord({"query": "python", "items": [{"title": "Video 1", "viewCount": 10}]})
+    assert captured["url"] == "https://discord.test/hook"
+    assert "[Video 1]" in captured["content"]
+
+
 def test_save_snapshot_requires_results(client):
     response = client.post("/api/save", json={"query": "python", "items": []})
     assert response.status_code == 400
@@ -125,6 +346,14 @@ def test_clear_archive_deletes_files(client, monkeypatch):
     assert response.get_json()["deleted"] == 3
 
 
+def test_clear_data_directory_keeps_gitkeep(data_dir):
+    (data_dir / ".gitkeep").write_text("")
+    (data_dir / "one.txt").write_text("a")
+    (data_dir / "nested").mkdir()
+    assert app_module.clear_data_directory() == 1
+    assert sorted(path.name for path in data_dir.iterdir()) == [".gitkeep", "nested"]
+
+
 def test_snapshot_listing(client, data_dir):
     (data_dir / "one.txt").write_text("a")
     (data_dir / "two.json").write_text("b")
@@ -143,13 +372,76 @@ def test_download_snapshot(client, data_dir):
     assert response.data == b"content"
 
 
+def test_download_snapshot_rejects_traversal(client, data_dir):
+    (data_dir.parent / "secret.txt").write_text("secret")
+    assert client.get("/archive/..%2Fsecret.txt").status_code == 404
+    assert client.get("/archive/missing.txt").status_code == 404
+
+
+def test_download_snapshot_revalidates(client, data_dir):
+    (data_dir / "demo.txt").write_text("content")
+    first = client.get("/archive/demo.txt")
+    assert first.headers["ETag"]
+    assert first.headers["Last-Modified"]
+    response = client.get("/archive/demo.txt", headers={"If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
 def test_auth_token_required(client, monkeypatch):
     monkeypatch.setattr(app_module, "APP_AUTH_TOKEN", "secret")
     response = client.post("/api/save", json={"query": "x", "items": [{"videoId": "1"}]})
     assert response.status_code == 401
+    assert response.get_json() == {"error": "Invalid or missing app token."}
     response = client.post(
         "/api/save",
         json={"query": "x", "items": [{"videoId": "1"}]},
         headers={"X-App-Token": "secret"},
     )
     assert response.status_code != 401
+
+
+def test_format_snapshot_text_layout():
+    snapshot = {
+        "query": "python",
+        "topic": "gaming",
+        "items": [
+            {"title": "Video 1", "url": "https://youtu.be/1", "viewCount": 10, "description": "About"},
+            {},
+        ],
+    }
+    text = app_module.format_snapshot_text(snapshot, "2024-01-01T00:00:00+00:00")
+    assert text.endswith(
+        "Topic filter: Gaming (global)\n"
+        "Results captured: 2\n"
+        "\n"
+        "1. Video 1 (https://youtu.be/1)\n"
+        "    Channel: Unknown | Published: Unknown | Views: 10\n"
+        "    Description: About\n"
+        "\n"
+        "2. Untitled video (https://youtube.com)\n"
+        "    Channel: Unknown | Published: Unknown | Views: 0\n"
+    )
+
+
+def test_write_snapshot_csv(data_dir):
+    snapshot = {
+        "query": "python",
+        "dateRange": "7d",
+        "duration": "any",
+        "items": [{"title": "Video 1", "url": "https://youtu.be/1", "viewCount": 10}],
+    }
+    file_path = app_module.write_snapshot_to_file(snapshot, export_format="csv")
+    header, row = file_path.read_text(encoding="utf-8").splitlines()
+    assert header.startswith("query,dateRange,duration,topic,savedAt,title")
+    assert row.startswith("python,7d,any,none,")
+    assert row.endswith(",Video 1,https://youtu.be/1,,,10,")
+
+
+def test_write_snapshot_json(data_dir):
+    snapshot = {"query": "python", "dateRange": "7d", "items": [{"title": "Vidéo", "viewCount": 10}]}
+    file_path = app_module.write_snapshot_to_file(snapshot, export_format="json")
+    payload = json.loads(file_path.read_text(encoding="utf-8"))
+    assert payload["query"] == "python"
+    assert payload["topic"] == "none"
+    assert payload["items"] == snapshot["items"]